@@ -6,18 +6,45 @@ This script executes the test queries against the i-miss-rust application
 and collects responses for evaluation purposes.
 """
 
+import argparse
+import copy
+import hashlib
 import json
 import subprocess
 import sys
+import threading
 import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import IO, Any, Deque, Dict, List
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
 
 # Configuration
 QUERIES_FILE = Path("evaluation/test_queries.json")
 RESPONSES_FILE = Path("evaluation/test_responses.json")
+RESPONSE_CACHE_DIR = Path("evaluation/.response_cache")  # Responses keyed by queries-file hash
 API_BASE_URL = "http://127.0.0.1:8080"  # Default API server address
 TIMEOUT_SECONDS = 30
+PROJECT_ROOT = Path("/Users/lowkey/Desktop/i-miss-rust")
+GC_BINARY = PROJECT_ROOT / "target" / "release" / "gc"  # Built once by build_ingest_binary()
+OUTPUT_TAIL_CHARS = 500  # Ingestion stdout/stderr kept per query
+PIPE_READ_SIZE = 4096
+VALIDATION_QUERY_TYPES = {"data_normalization", "cross_provider_reconciliation", "currency_conversion"}
+API_MAX_WORKERS = 8  # Concurrent API queries (kept below the session pool size)
+
+# Shared HTTP session so API queries reuse keep-alive connections
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=20))
+
+# In-process cache of API responses keyed by (endpoint, params)
+_RESPONSE_CACHE: Dict[str, Dict[str, Any]] = {}
+_RESPONSE_CACHE_LOCK = threading.Lock()
+_RESPONSE_KEY_LOCKS: Dict[str, threading.Lock] = {}
 
 
 def load_queries() -> List[Dict[str, Any]]:
@@ -26,16 +53,51 @@ def load_queries() -> List[Dict[str, Any]]:
         return json.load(f)
 
 
-def run_api_query(query: Dict[str, Any]) -> Dict[str, Any]:
-    """Execute an API query and collect the response."""
-    import requests
-    
+def api_cache_key(endpoint: str, params: Dict[str, Any]) -> str:
+    """Hash an endpoint and its parameters into a stable cache key."""
+    query_string = urlencode(sorted(params.items()), doseq=True)
+    return hashlib.sha1(f"{endpoint}?{query_string}".encode()).hexdigest()
+
+
+def run_api_query(query: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+    """Execute an API query, reusing the response of an identical earlier query."""
     endpoint = query.get("endpoint", "/api/health")
     params = query.get("parameters", {})
-    
+
+    if not use_cache:
+        return fetch_api_query(query, endpoint, params)
+
+    key = api_cache_key(endpoint, params)
+    with _RESPONSE_CACHE_LOCK:
+        key_lock = _RESPONSE_KEY_LOCKS.setdefault(key, threading.Lock())
+
+    # Identical queries in flight on other workers wait here for the first result
+    with key_lock:
+        cached = _RESPONSE_CACHE.get(key)
+        if cached is None:
+            response = fetch_api_query(query, endpoint, params)
+            if response.get("success"):
+                _RESPONSE_CACHE[key] = copy.deepcopy(response)
+            return response
+
+    # Mark the reuse so no latency is reported for a request that never happened
+    response = copy.deepcopy(cached)
+    response.update({
+        "query_id": query["id"],
+        "query_type": query["type"],
+        "query": query["query"],
+        "response_time_ms": None,
+        "cached": True,
+        "timestamp": time.time()
+    })
+    return response
+
+
+def fetch_api_query(query: Dict[str, Any], endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute an API query and collect the response."""
     try:
         url = f"{API_BASE_URL}{endpoint}"
-        response = requests.get(url, params=params, timeout=TIMEOUT_SECONDS)
+        response = SESSION.get(url, params=params, timeout=TIMEOUT_SECONDS)
         
         return {
             "query_id": query["id"],
@@ -58,37 +120,76 @@ def run_api_query(query: Dict[str, Any]) -> Dict[str, Any]:
         }
 
 
+def build_ingest_binary() -> None:
+    """Build the gc binary once so ingestion queries skip cargo's per-run freshness check."""
+    print("🔨 Building gc ingest binary...")
+    subprocess.run(
+        ["cargo", "build", "--release", "--bin", "gc"],
+        check=True,
+        cwd=PROJECT_ROOT
+    )
+
+
+def tail_pipe(pipe: IO[str], tail: Deque[str]) -> None:
+    """Read a pipe to EOF, keeping only the characters that fit in ``tail``."""
+    with pipe:
+        for chunk in iter(lambda: pipe.read(PIPE_READ_SIZE), ""):
+            tail.extend(chunk)
+
+
 def run_provider_ingestion(query: Dict[str, Any]) -> Dict[str, Any]:
     """Execute a provider ingestion and collect results."""
     provider = query.get("provider", "unknown")
     product_id = query.get("product_id", "")
     
     try:
-        # Run the ingest binary for specific provider
+        # Run the prebuilt ingest binary for specific provider
         cmd = [
-            "cargo", "run", "--bin", "gc", "--",
+            str(GC_BINARY),
             "ingest", "--provider", provider,
             "--product-id", product_id
         ]
         
-        result = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
-            timeout=TIMEOUT_SECONDS,
-            cwd="/Users/lowkey/Desktop/i-miss-rust"
+            encoding="utf-8",
+            errors="replace",  # Undecodable output must not stop the pipe pumps
+            cwd=PROJECT_ROOT
         )
         
+        # Drain both pipes concurrently, keeping only the tail of each
+        stdout_tail: Deque[str] = deque(maxlen=OUTPUT_TAIL_CHARS)
+        stderr_tail: Deque[str] = deque(maxlen=OUTPUT_TAIL_CHARS)
+        pumps = [
+            threading.Thread(target=tail_pipe, args=(proc.stdout, stdout_tail), daemon=True),
+            threading.Thread(target=tail_pipe, args=(proc.stderr, stderr_tail), daemon=True),
+        ]
+        for pump in pumps:
+            pump.start()
+        
+        try:
+            returncode = proc.wait(timeout=TIMEOUT_SECONDS)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            for pump in pumps:
+                pump.join()
+        
         return {
             "query_id": query["id"],
             "query_type": query["type"],
             "query": query["query"],
             "provider": provider,
             "product_id": product_id,
-            "exit_code": result.returncode,
-            "stdout": result.stdout[-500:] if len(result.stdout) > 500 else result.stdout,  # Last 500 chars
-            "stderr": result.stderr[-500:] if len(result.stderr) > 500 else result.stderr,
-            "success": result.returncode == 0,
+            "exit_code": returncode,
+            "stdout": "".join(stdout_tail),  # Last 500 chars
+            "stderr": "".join(stderr_tail),
+            "success": returncode == 0,
             "timestamp": time.time()
         }
     except subprocess.TimeoutExpired:
@@ -111,6 +212,20 @@ def run_provider_ingestion(query: Dict[str, Any]) -> Dict[str, Any]:
         }
 
 
+def report_ingest_build_failure(query: Dict[str, Any], error: str) -> Dict[str, Any]:
+    """Report an ingestion query that could not run because the gc build failed."""
+    return {
+        "query_id": query["id"],
+        "query_type": query["type"],
+        "query": query["query"],
+        "provider": query.get("provider", "unknown"),
+        "product_id": query.get("product_id", ""),
+        "error": error,
+        "success": False,
+        "timestamp": time.time()
+    }
+
+
 def run_data_validation(query: Dict[str, Any]) -> Dict[str, Any]:
     """Execute data validation queries against the database."""
     # This would connect directly to PostgreSQL for validation
@@ -125,39 +240,92 @@ def run_data_validation(query: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def collect_responses() -> List[Dict[str, Any]]:
-    """Execute all queries and collect responses."""
+def run_unknown_query(query: Dict[str, Any]) -> Dict[str, Any]:
+    """Report a query whose type has no handler."""
+    query_type = query.get("type", "")
+    return {
+        "query_id": query["id"],
+        "query_type": query_type,
+        "error": f"Unknown query type: {query_type}",
+        "success": False,
+        "timestamp": time.time()
+    }
+
+
+def dispatch_for(query: Dict[str, Any]) -> str:
+    """Map a query to the handler group that executes it."""
+    query_type = query.get("type", "")
+
+    if "api_" in query_type:
+        return "api"
+    elif query_type == "provider_ingestion":
+        return "ingest"
+    elif query_type in VALIDATION_QUERY_TYPES:
+        return "validation"
+    return "unknown"
+
+
+# Handlers for groups that run serially (cargo ingestion, validation, ...)
+SERIAL_HANDLERS = {
+    "ingest": run_provider_ingestion,
+    "validation": run_data_validation,
+    "unknown": run_unknown_query,
+}
+
+
+def collect_responses(use_cache: bool = True, cached: Dict[str, Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Execute all queries and collect responses.
+
+    Queries whose id is in ``cached`` reuse that response instead of running again.
+    """
     queries = load_queries()
-    responses = []
-    
+    responses: List[Dict[str, Any]] = [None] * len(queries)
+    cached = cached or {}
+
     print(f"🔄 Collecting responses for {len(queries)} queries...")
-    
-    for i, query in enumerate(queries, 1):
-        print(f"\n[{i}/{len(queries)}] Processing: {query['id']} - {query['type']}")
-        
-        query_type = query.get("type", "")
-        
-        if "api_" in query_type:
-            response = run_api_query(query)
-        elif query_type == "provider_ingestion":
-            response = run_provider_ingestion(query)
-        elif query_type in ["data_normalization", "cross_provider_reconciliation", "currency_conversion"]:
-            response = run_data_validation(query)
-        else:
-            response = {
-                "query_id": query["id"],
-                "query_type": query_type,
-                "error": f"Unknown query type: {query_type}",
-                "success": False,
-                "timestamp": time.time()
-            }
-        
-        responses.append(response)
+
+    # Group query indices by handler once, instead of re-testing types per query
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for index, query in enumerate(queries):
+        if query["id"] in cached:
+            responses[index] = {**cached[query["id"]], "cached": True}
+            continue
+        groups[dispatch_for(query)].append(index)
+
+    reused = len(queries) - sum(len(indices) for indices in groups.values())
+    if reused:
+        print(f"♻️  Reusing {reused} cached successful responses (pass --refresh to re-collect)")
+
+    def report(index: int, response: Dict[str, Any]) -> None:
+        query = queries[index]
+        print(f"\n[{index + 1}/{len(queries)}] Processing: {query['id']} - {query['type']}")
         print(f"  Status: {'✅ Success' if response.get('success') else '❌ Failed'}")
-        
-        # Small delay between requests
-        time.sleep(0.5)
-    
+
+    # API queries are network-bound, so run them concurrently over the shared
+    # session; every other group stays serial.
+    api_indices = groups.pop("api", [])
+    with ThreadPoolExecutor(max_workers=API_MAX_WORKERS) as executor:
+        api_results = executor.map(partial(run_api_query, use_cache=use_cache), (queries[i] for i in api_indices))
+        for index, response in zip(api_indices, api_results):
+            responses[index] = response
+            report(index, response)
+
+    handlers = dict(SERIAL_HANDLERS)
+    if groups.get("ingest"):
+        try:
+            build_ingest_binary()
+        except (subprocess.CalledProcessError, OSError) as e:
+            # Fail just the ingestion queries so everything else is still saved
+            print(f"❌ gc build failed: {e}")
+            handlers["ingest"] = partial(report_ingest_build_failure, error=f"gc build failed: {e}")
+
+    for tag, indices in groups.items():
+        handler = handlers[tag]
+        for index in indices:
+            response = handler(queries[index])
+            responses[index] = response
+            report(index, response)
+
     return responses
 
 
@@ -171,8 +339,52 @@ def save_responses(responses: List[Dict[str, Any]]) -> None:
     print(f"\n✅ Saved {len(responses)} responses to {RESPONSES_FILE}")
 
 
+def response_cache_path() -> Path:
+    """Return the cache file for the current contents of the queries file."""
+    queries_hash = hashlib.sha1(QUERIES_FILE.read_bytes()).hexdigest()
+    return RESPONSE_CACHE_DIR / f"{queries_hash}.json"
+
+
+def load_response_cache(cache_path: Path) -> Dict[str, Dict[str, Any]]:
+    """Load cached successful responses keyed by query id."""
+    if not cache_path.exists():
+        return {}
+
+    with open(cache_path, 'r') as f:
+        return {r["query_id"]: r for r in json.load(f) if r.get("success")}
+
+
+def save_response_cache(responses: List[Dict[str, Any]], cache_path: Path) -> None:
+    """Persist successful responses so unchanged queries can be re-judged without re-running.
+
+    Failures are never cached, so they are retried on the next run.
+    """
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(cache_path, 'w') as f:
+        json.dump([r for r in responses if r.get("success")], f, indent=2)
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Run every query, reusing neither duplicate API responses nor the on-disk cache",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore the on-disk cache for the current queries file and collect again",
+    )
+    return parser.parse_args()
+
+
 def main():
     """Main execution function."""
+    args = parse_args()
+
     print("🚀 i-miss-rust Evaluation Response Collection")
     print("=" * 60)
     
@@ -183,7 +395,11 @@ def main():
     
     # Collect responses
     try:
-        responses = collect_responses()
+        cache_path = response_cache_path()
+        use_disk_cache = not (args.refresh or args.no_cache)
+        cached = load_response_cache(cache_path) if use_disk_cache else {}
+        responses = collect_responses(use_cache=not args.no_cache, cached=cached)
+        save_response_cache(responses, cache_path)
         save_responses(responses)
         
         # Summary
@@ -199,6 +415,8 @@ def main():
     except Exception as e:
         print(f"\n❌ Error during collection: {e}")
         sys.exit(1)
+    finally:
+        SESSION.close()
 
 
 if __name__ == "__main__":
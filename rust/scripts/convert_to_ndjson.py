@@ -1,8 +1,24 @@
 #!/usr/bin/env python3
-import sys
 import json
+import mmap
+import re
+import sys
 from pathlib import Path
 
+import orjson
+
+WRITE_BUFFER_SIZE = 1 << 20
+# orjson is exact only for integers in [-2**63, 2**64) and silently turns wider ones
+# into floats; any run of 19+ digits sends the file through the stdlib instead.
+WIDE_INT_RE = re.compile(rb"\d{19,}")
+
+def dumps_exact(obj):
+    try:
+        return orjson.dumps(obj)
+    except orjson.JSONEncodeError:
+        # Integers wider than 64 bits
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 def main():
     if len(sys.argv) < 3:
         print("usage: convert_to_ndjson.py <input.json> <output.ndjson>", file=sys.stderr)
@@ -10,8 +26,15 @@ def main():
     src = Path(sys.argv[1])
     dst = Path(sys.argv[2])
 
-    with src.open('r', encoding='utf-8') as f:
-        data = json.load(f)
+    # Parse straight from the mapped file; orjson reads the memoryview without a copy
+    with src.open('rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if WIDE_INT_RE.search(mm):
+            data = json.loads(mm[:])
+            dumps = dumps_exact
+        else:
+            with memoryview(mm) as view:
+                data = orjson.loads(view)
+            dumps = orjson.dumps
 
     if isinstance(data, dict):
         # Prefer a primary array field if present (e.g., {"games": [ ... ]})
@@ -31,10 +54,10 @@ def main():
         print("unsupported top-level JSON type", file=sys.stderr)
         sys.exit(3)
 
-    with dst.open('w', encoding='utf-8') as out:
+    with dst.open('wb', buffering=WRITE_BUFFER_SIZE) as out:
         for obj in items:
-            json.dump(obj, out, ensure_ascii=False, separators=(",", ":"))
-            out.write("\n")
+            out.write(dumps(obj))
+            out.write(b"\n")
 
     print(f"wrote {dst} with {len(items)} lines")
 
@@ -16,14 +16,20 @@ from __future__ import annotations
 
 import argparse
 import csv
-import json
+import heapq
 from collections import defaultdict
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from decimal import Decimal, ROUND_HALF_UP, getcontext
 from datetime import datetime
+from itertools import groupby
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Tuple
-from urllib.request import Request, urlopen
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 getcontext().prec = 40
 
@@ -31,17 +37,21 @@ FX_API_URL = "https://open.er-api.com/v6/latest/USD"
 BTC_PRICE_URL = "https://min-api.cryptocompare.com/data/price?fsym=BTC&tsyms=USD"
 USER_AGENT = "GameCompare/price-export (+https://github.com/lowkey/i-miss-rust)"
 
+# Shared session so the FX and BTC lookups reuse connections and retry transient failures
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_maxsize=4, max_retries=Retry(total=3, backoff_factor=0.5)))
+
 BTC_QUANT = Decimal("0.00000001")
 USD_QUANT = Decimal("0.01")
 
 
 @dataclass
 class PricePoint:
-    amount_minor: Decimal
+    amount_minor: int
     minor_unit: int
-    amount_local: Decimal
-    amount_usd: Decimal
-    amount_btc: Decimal
+    amount_local: float
+    amount_usd: float
+    amount_btc: float
     currency: str
     country_iso2: str
     country_name: str
@@ -51,25 +61,25 @@ class PricePoint:
     def formatted_local(self) -> str:
         if self.minor_unit <= 0:
             quant = Decimal(1)
-            value = self.amount_local.quantize(quant, rounding=ROUND_HALF_UP)
+            value = to_decimal(self.amount_local).quantize(quant, rounding=ROUND_HALF_UP)
             return f"{value:.0f}"
         quant = Decimal(10) ** (-self.minor_unit)
-        value = self.amount_local.quantize(quant, rounding=ROUND_HALF_UP)
+        value = to_decimal(self.amount_local).quantize(quant, rounding=ROUND_HALF_UP)
         return f"{value:.{self.minor_unit}f}"
 
     def formatted_usd(self) -> str:
-        value = self.amount_usd.quantize(USD_QUANT, rounding=ROUND_HALF_UP)
+        value = to_decimal(self.amount_usd).quantize(USD_QUANT, rounding=ROUND_HALF_UP)
         return f"{value:.2f}"
 
     def formatted_btc(self) -> str:
-        value = self.amount_btc.quantize(BTC_QUANT, rounding=ROUND_HALF_UP)
+        value = to_decimal(self.amount_btc).quantize(BTC_QUANT, rounding=ROUND_HALF_UP)
         return f"{value:.8f}"
 
     def to_json_dict(self) -> Dict[str, object]:
         return {
             "amount_btc": self.formatted_btc(),
             "amount_local": self.formatted_local(),
-            "amount_minor": int(self.amount_minor),
+            "amount_minor": self.amount_minor,
             "currency": self.currency,
             "minor_unit": self.minor_unit,
             "country": self.country_iso2,
@@ -92,33 +102,63 @@ class SellableRecord:
     product_name: str
     price_points: List[PricePoint]
     last_recorded_at: Optional[datetime]
+    _min_point: Optional[PricePoint] = field(default=None, init=False, repr=False, compare=False)
+    _max_point: Optional[PricePoint] = field(default=None, init=False, repr=False, compare=False)
+    title_lc: str = field(default="", init=False, repr=False, compare=False)
+    points_by_btc: List[PricePoint] = field(default_factory=list, init=False, repr=False, compare=False)
+    export_prefix: Tuple[str, ...] = field(default=(), init=False, repr=False, compare=False)
+
+    def finalize(self) -> None:
+        """Cache the cheapest/costliest points in a single pass once ingestion is done."""
+        min_point = max_point = self.price_points[0]
+        for point in self.price_points:
+            if point.amount_btc < min_point.amount_btc:
+                min_point = point
+            if point.amount_btc > max_point.amount_btc:
+                max_point = point
+        self._min_point = min_point
+        self._max_point = max_point
+        self.title_lc = self.title.lower()
+        self.points_by_btc = sorted(self.price_points, key=lambda p: p.amount_btc)
+        # Leading identity columns shared by every export row for this record
+        self.export_prefix = (
+            self.sellable_id,
+            self.sellable_kind,
+            self.title,
+            self.platform_code,
+            self.platform_name,
+            self.retailer_slug,
+            self.retailer_name,
+            self.product_slug,
+            self.product_name,
+        )
 
     def min_point(self) -> PricePoint:
-        return min(self.price_points, key=lambda p: p.amount_btc)
+        return self._min_point
 
     def max_point(self) -> PricePoint:
-        return max(self.price_points, key=lambda p: p.amount_btc)
+        return self._max_point
 
-    def min_btc(self) -> Decimal:
-        return self.min_point().amount_btc
+    def min_btc(self) -> float:
+        return self._min_point.amount_btc
 
-    def max_btc(self) -> Decimal:
-        return self.max_point().amount_btc
+    def max_btc(self) -> float:
+        return self._max_point.amount_btc
 
-    def spread_btc(self) -> Decimal:
-        return self.max_btc() - self.min_btc()
+    def spread_btc(self) -> float:
+        return self._max_point.amount_btc - self._min_point.amount_btc
 
-    def spread_pct(self) -> Decimal:
-        min_val = self.min_btc()
+    def spread_pct(self) -> float:
+        min_val = self._min_point.amount_btc
         if min_val == 0:
-            return Decimal(0)
-        return (self.max_btc() / min_val) - Decimal(1)
+            return 0.0
+        return (self._max_point.amount_btc / min_val) - 1.0
 
 
 def fetch_json(url: str) -> dict:
-    req = Request(url, headers={"User-Agent": USER_AGENT})
-    with urlopen(req) as resp:  # noqa: S310 - trusted endpoints defined above
-        return json.load(resp)
+    resp = SESSION.get(url, headers={"User-Agent": USER_AGENT}, timeout=30)
+    resp.raise_for_status()
+    return resp.json()
 
 
 def fetch_rates() -> Tuple[Dict[str, Decimal], str, Decimal]:
@@ -137,12 +177,17 @@ def fetch_rates() -> Tuple[Dict[str, Decimal], str, Decimal]:
     return rates, fx_timestamp, btc_usd_price
 
 
-def format_btc(value: Decimal) -> str:
-    return f"{value.quantize(BTC_QUANT, rounding=ROUND_HALF_UP):.8f}"
+def to_decimal(value: float) -> Decimal:
+    # Conversions run on FP64; Decimal is only used to quantize at format time.
+    return Decimal(repr(value))
+
+
+def format_btc(value: float) -> str:
+    return f"{to_decimal(value).quantize(BTC_QUANT, rounding=ROUND_HALF_UP):.8f}"
 
 
-def format_pct(value: Decimal) -> str:
-    percent = (value * Decimal(100)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+def format_pct(value: float) -> str:
+    percent = (to_decimal(value) * Decimal(100)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
     return f"{percent:.2f}"
 
 
@@ -158,16 +203,20 @@ def choose_title(row: Dict[str, str]) -> str:
 
 
 def load_sellables(raw_path: Path, rates: Dict[str, Decimal], btc_usd_price: Decimal) -> List[SellableRecord]:
-    sellables: Dict[Tuple[str, str, str, str, str, str, str, str, str], SellableRecord] = {}
+    sellables: Dict[Tuple[str, str], SellableRecord] = {}
+    # Cache divisors and reciprocals so the row loop only multiplies.
+    divisors = {minor_unit: 10.0 ** minor_unit for minor_unit in range(0, 5)}
+    usd_per_local = {code: 1.0 / float(value) for code, value in rates.items() if value != 0}
+    btc_per_usd = 1.0 / float(btc_usd_price)
 
     with raw_path.open(newline="") as infile:
         reader = csv.DictReader(infile)
         for row in reader:
             currency = row["currency_code"]
-            if currency not in rates:
-                raise SystemExit(f"Missing FX rate for currency: {currency}")
-            rate = rates[currency]
-            if rate == 0:
+            usd_rate = usd_per_local.get(currency)
+            if usd_rate is None:
+                if currency not in rates:
+                    raise SystemExit(f"Missing FX rate for currency: {currency}")
                 raise SystemExit(f"Zero FX rate for currency: {currency}")
 
             try:
@@ -175,11 +224,11 @@ def load_sellables(raw_path: Path, rates: Dict[str, Decimal], btc_usd_price: Dec
             except ValueError:
                 minor_unit = 2
 
-            amount_minor = Decimal(row["amount_minor"])
-            divisor = Decimal(10) ** minor_unit
+            amount_minor = int(Decimal(row["amount_minor"]))
+            divisor = divisors.get(minor_unit) or 10.0 ** minor_unit
             amount_local = amount_minor / divisor
-            amount_usd = amount_local / rate
-            amount_btc = amount_usd / btc_usd_price
+            amount_usd = amount_local * usd_rate
+            amount_btc = amount_usd * btc_per_usd
 
             country_code = row.get("country_iso2") or ""
             recorded_at_raw = row.get("recorded_at") or ""
@@ -190,17 +239,9 @@ def load_sellables(raw_path: Path, rates: Dict[str, Decimal], btc_usd_price: Dec
                 except ValueError:  # pragma: no cover - malformed timestamp guard
                     recorded_at = None
 
-            key = (
-                row["sellable_id"],
-                row["sellable_kind"],
-                row["retailer_slug"],
-                row["retailer_name"],
-                row.get("product_slug") or "",
-                row.get("product_name") or "",
-                row.get("platform_code") or "",
-                row.get("platform_name") or "",
-                choose_title(row),
-            )
+            # Offers are unique per sellable and retailer; the remaining
+            # descriptive columns are identical across those rows.
+            key = (row["sellable_id"], row["retailer_slug"])
 
             price_point = PricePoint(
                 amount_minor=amount_minor,
@@ -218,15 +259,15 @@ def load_sellables(raw_path: Path, rates: Dict[str, Decimal], btc_usd_price: Dec
             record = sellables.get(key)
             if not record:
                 record = SellableRecord(
-                    sellable_id=key[0],
-                    sellable_kind=key[1],
-                    title=key[8],
-                    platform_code=key[6],
-                    platform_name=key[7],
-                    retailer_slug=key[2],
-                    retailer_name=key[3],
-                    product_slug=key[4],
-                    product_name=key[5],
+                    sellable_id=row["sellable_id"],
+                    sellable_kind=row["sellable_kind"],
+                    title=choose_title(row),
+                    platform_code=row.get("platform_code") or "",
+                    platform_name=row.get("platform_name") or "",
+                    retailer_slug=row["retailer_slug"],
+                    retailer_name=row["retailer_name"],
+                    product_slug=row.get("product_slug") or "",
+                    product_name=row.get("product_name") or "",
                     price_points=[],
                     last_recorded_at=recorded_at,
                 )
@@ -237,6 +278,9 @@ def load_sellables(raw_path: Path, rates: Dict[str, Decimal], btc_usd_price: Dec
 
             record.price_points.append(price_point)
 
+    for record in sellables.values():
+        record.finalize()
+
     return list(sellables.values())
 
 
@@ -261,34 +305,24 @@ def write_aggregated(path: Path, sellables: Iterable[SellableRecord], btc_usd_re
         "fx_timestamp",
     ]
 
+    btc_usd_ref = f"{btc_usd_reference.quantize(USD_QUANT, rounding=ROUND_HALF_UP):.2f}"
     rows = []
     for record in sellables:
-        points_sorted = sorted(record.price_points, key=lambda p: p.amount_btc)
-        rows.append({
-            "sellable_id": record.sellable_id,
-            "sellable_kind": record.sellable_kind,
-            "title": record.title,
-            "platform_code": record.platform_code,
-            "platform_name": record.platform_name,
-            "retailer_slug": record.retailer_slug,
-            "retailer_name": record.retailer_name,
-            "product_slug": record.product_slug,
-            "product_name": record.product_name,
-            "base_currency": "BTC",
-            "price_point_count": len(points_sorted),
-            "price_points_json": json.dumps([p.to_json_dict() for p in points_sorted], ensure_ascii=False, separators=(",", ":")),
-            "min_amount_btc": format_btc(record.min_btc()),
-            "max_amount_btc": format_btc(record.max_btc()),
-            "last_recorded_at": record.last_recorded_at.isoformat() if record.last_recorded_at else "",
-            "btc_usd_reference": f"{btc_usd_reference.quantize(USD_QUANT, rounding=ROUND_HALF_UP):.2f}",
-            "fx_timestamp": fx_timestamp,
-        })
-
-    rows.sort(key=lambda row: (row["title"].lower(), row["retailer_slug"]))
+        points_sorted = record.points_by_btc
+        rows.append(record.export_prefix + (
+            "BTC",
+            len(points_sorted),
+            orjson.dumps([p.to_json_dict() for p in points_sorted]).decode("utf-8"),
+            format_btc(record.min_btc()),
+            format_btc(record.max_btc()),
+            record.last_recorded_at.isoformat() if record.last_recorded_at else "",
+            btc_usd_ref,
+            fx_timestamp,
+        ))
 
     with path.open("w", newline="") as outfile:
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
+        writer = csv.writer(outfile)
+        writer.writerow(fieldnames)
         writer.writerows(rows)
 
 
@@ -315,37 +349,27 @@ def write_summary(path: Path, sellables: Iterable[SellableRecord], btc_usd_refer
         "fx_timestamp",
     ]
 
+    btc_usd_ref = f"{btc_usd_reference.quantize(USD_QUANT, rounding=ROUND_HALF_UP):.2f}"
     rows = []
     for record in sellables:
         min_point = record.min_point()
         max_point = record.max_point()
-        rows.append({
-            "sellable_id": record.sellable_id,
-            "sellable_kind": record.sellable_kind,
-            "title": record.title,
-            "platform_code": record.platform_code,
-            "platform_name": record.platform_name,
-            "retailer_slug": record.retailer_slug,
-            "retailer_name": record.retailer_name,
-            "product_slug": record.product_slug,
-            "product_name": record.product_name,
-            "price_point_count": len(record.price_points),
-            "min_amount_btc": format_btc(record.min_btc()),
-            "max_amount_btc": format_btc(record.max_btc()),
-            "spread_btc": format_btc(record.spread_btc()),
-            "spread_percent": format_pct(record.spread_pct()),
-            "cheapest_region": min_point.region_label or min_point.country_iso2,
-            "costliest_region": max_point.region_label or max_point.country_iso2,
-            "last_recorded_at": record.last_recorded_at.isoformat() if record.last_recorded_at else "",
-            "btc_usd_reference": f"{btc_usd_reference.quantize(USD_QUANT, rounding=ROUND_HALF_UP):.2f}",
-            "fx_timestamp": fx_timestamp,
-        })
-
-    rows.sort(key=lambda row: (row["title"].lower(), row["retailer_slug"]))
+        rows.append(record.export_prefix + (
+            len(record.price_points),
+            format_btc(record.min_btc()),
+            format_btc(record.max_btc()),
+            format_btc(record.spread_btc()),
+            format_pct(record.spread_pct()),
+            min_point.region_label or min_point.country_iso2,
+            max_point.region_label or max_point.country_iso2,
+            record.last_recorded_at.isoformat() if record.last_recorded_at else "",
+            btc_usd_ref,
+            fx_timestamp,
+        ))
 
     with path.open("w", newline="") as outfile:
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
+        writer = csv.writer(outfile)
+        writer.writerow(fieldnames)
         writer.writerows(rows)
 
 
@@ -377,51 +401,42 @@ def write_points(path: Path, sellables: Iterable[SellableRecord], btc_usd_refere
         "fx_timestamp",
     ]
 
+    btc_usd_ref = f"{btc_usd_reference.quantize(USD_QUANT, rounding=ROUND_HALF_UP):.2f}"
     rows = []
-    for record in sellables:
-        min_btc = record.min_btc()
-        for point in record.price_points:
+    for _, group in groupby(sellables, key=lambda r: (r.title_lc, r.retailer_slug)):
+        # Records sharing a title/retailer interleave their points by BTC amount.
+        group_points = heapq.merge(
+            *([(point, record) for point in record.points_by_btc] for record in group),
+            key=lambda pair: pair[0].amount_btc,
+        )
+        for point, record in group_points:
+            min_btc = record.min_btc()
             delta = point.amount_btc - min_btc
-            delta_pct = Decimal(0)
+            delta_pct = 0.0
             if min_btc != 0:
-                delta_pct = (point.amount_btc / min_btc) - Decimal(1)
-
-            rows.append({
-                "sellable_id": record.sellable_id,
-                "sellable_kind": record.sellable_kind,
-                "title": record.title,
-                "platform_code": record.platform_code,
-                "platform_name": record.platform_name,
-                "retailer_slug": record.retailer_slug,
-                "retailer_name": record.retailer_name,
-                "product_slug": record.product_slug,
-                "product_name": record.product_name,
-                "country_iso2": point.country_iso2,
-                "country_name": point.country_name,
-                "region_label": point.region_label,
-                "currency_code": point.currency,
-                "currency_minor_unit": point.minor_unit,
-                "amount_minor": int(point.amount_minor),
-                "amount_local": point.formatted_local(),
-                "amount_usd": point.formatted_usd(),
-                "amount_btc": point.formatted_btc(),
-                "delta_from_min_btc": format_btc(delta if delta >= 0 else Decimal(0)),
-                "delta_pct_vs_min": format_pct(delta_pct),
-                "is_min_price": "1" if point.amount_btc == min_btc else "0",
-                "recorded_at": point.recorded_at_raw,
-                "btc_usd_reference": f"{btc_usd_reference.quantize(USD_QUANT, rounding=ROUND_HALF_UP):.2f}",
-                "fx_timestamp": fx_timestamp,
-            })
-
-    rows.sort(key=lambda row: (
-        row["title"].lower(),
-        row["retailer_slug"],
-        Decimal(row["amount_btc"])
-    ))
+                delta_pct = (point.amount_btc / min_btc) - 1.0
+
+            rows.append(record.export_prefix + (
+                point.country_iso2,
+                point.country_name,
+                point.region_label,
+                point.currency,
+                point.minor_unit,
+                point.amount_minor,
+                point.formatted_local(),
+                point.formatted_usd(),
+                point.formatted_btc(),
+                format_btc(delta if delta >= 0 else 0.0),
+                format_pct(delta_pct),
+                "1" if point.amount_btc == min_btc else "0",
+                point.recorded_at_raw,
+                btc_usd_ref,
+                fx_timestamp,
+            ))
 
     with path.open("w", newline="") as outfile:
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
+        writer = csv.writer(outfile)
+        writer.writerow(fieldnames)
         writer.writerows(rows)
 
 
@@ -453,14 +468,23 @@ def main() -> None:
 
     rates, fx_timestamp, btc_usd_price = fetch_rates()
     sellables = load_sellables(raw_path, rates, btc_usd_price)
+    # Sort once; every writer emits records in this order.
+    sellables.sort(key=lambda r: (r.title_lc, r.retailer_slug))
 
     aggregated_path = out_dir / "game_prices_latest_btc.csv"
     summary_path = out_dir / "game_prices_latest_btc_summary.csv"
     points_path = out_dir / "game_prices_latest_btc_points.csv"
 
-    write_aggregated(aggregated_path, sellables, btc_usd_price, fx_timestamp)
-    write_summary(summary_path, sellables, btc_usd_price, fx_timestamp)
-    write_points(points_path, sellables, btc_usd_price, fx_timestamp)
+    # The writers are independent and CPU-bound (Decimal formatting, JSON), so
+    # run them in separate processes rather than one after another.
+    with ProcessPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(write_aggregated, aggregated_path, sellables, btc_usd_price, fx_timestamp),
+            executor.submit(write_summary, summary_path, sellables, btc_usd_price, fx_timestamp),
+            executor.submit(write_points, points_path, sellables, btc_usd_price, fx_timestamp),
+        ]
+        for future in futures:
+            future.result()
 
     print(f"Aggregated export written to {aggregated_path}")
     print(f"Summary export written to    {summary_path}")
@@ -1,13 +1,77 @@
 #!/usr/bin/env python3
-import os, json, requests
+import os, json, hashlib, requests
+from requests.adapters import HTTPAdapter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 
 # 1) Paste the *live.com* access_token (scope: service::user.auth.xboxlive.com::MBI_SSL)
 MSA_ACCESS_TOKEN = os.environ.get("MSA_ACCESS_TOKEN", "").strip()
 if not MSA_ACCESS_TOKEN:
     raise SystemExit("Set MSA_ACCESS_TOKEN to the live.com access_token first")
 
+# RelyingParty depends on what you will call next.
+# For many Xbox consumer APIs, "http://xboxlive.com" is the common choice.
+# Allow override via env var.
+RELYING_PARTY = os.environ.get("XSTS_RELYING_PARTY", "http://xboxlive.com").strip() or "http://xboxlive.com"
+
+# XBL/XSTS tokens stay valid for hours; reuse them until shortly before NotAfter.
+CACHE = Path(os.environ.get("XSTS_CACHE", "~/.cache/game_compare/xsts.json")).expanduser()
+CACHE_SKEW = timedelta(seconds=60)
+MSA_TOKEN_HASH = hashlib.sha256(MSA_ACCESS_TOKEN.encode("utf-8")).hexdigest()
+
+def print_exports(uhs, xsts_token):
+    # Print shell-safe exports so you can do: eval "$(python src/get_xsts.py)"
+    print(f'export XSTS_UHS="{uhs}"')
+    print(f'export XSTS_TOKEN="{xsts_token}"')
+    print(f'export XBL3_AUTH="XBL3.0 x={uhs};{xsts_token}"')
+    print(f'export XSTS_RELYING_PARTY="{RELYING_PARTY}"')
+
+def parse_expiry(value):
+    try:
+        expires_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    return expires_at if expires_at.tzinfo else expires_at.replace(tzinfo=timezone.utc)
+
+def load_cached_tokens():
+    try:
+        cached = json.loads(CACHE.read_text())
+    except (OSError, ValueError):
+        return None
+    # Tokens are only reusable for the same MSA token and relying party
+    if cached.get("msa_token_hash") != MSA_TOKEN_HASH or cached.get("relying_party") != RELYING_PARTY:
+        return None
+    expires_at = parse_expiry(cached.get("expires_at"))
+    if expires_at is None or expires_at <= datetime.now(timezone.utc) + CACHE_SKEW:
+        return None
+    return cached
+
+def save_cached_tokens(xbl_token, xsts_token, uhs, expires_at):
+    CACHE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CACHE.with_suffix(".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump({
+            "msa_token_hash": MSA_TOKEN_HASH,
+            "relying_party": RELYING_PARTY,
+            "xbl_token": xbl_token,
+            "xsts_token": xsts_token,
+            "uhs": uhs,
+            "expires_at": expires_at,
+        }, f)
+    tmp.replace(CACHE)
+
+cached = load_cached_tokens()
+if cached:
+    print_exports(cached["uhs"], cached["xsts_token"])
+    raise SystemExit(0)
+
+# One session so the XBL -> XSTS sequence reuses TLS connections to xboxlive.com
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_maxsize=4))
+
 def post_json(url, payload):
-    r = requests.post(url, json=payload, headers={"Content-Type": "application/json"}, timeout=30)
+    r = SESSION.post(url, json=payload, headers={"Content-Type": "application/json"}, timeout=30)
     return r.status_code, r.headers, r.text
 
 # 2) XBL user token
@@ -35,11 +99,7 @@ xbl_token = xbl["Token"]
 uhs = xbl["DisplayClaims"]["xui"][0]["uhs"]
 
 # 3) XSTS token (RETAIL sandbox)
-# RelyingParty depends on what you will call next.
-# For many Xbox consumer APIs, "http://xboxlive.com" is the common choice.
-# Allow override via env var.
 xsts_url = "https://xsts.auth.xboxlive.com/xsts/authorize"
-RELYING_PARTY = os.environ.get("XSTS_RELYING_PARTY", "http://xboxlive.com").strip() or "http://xboxlive.com"
 
 xsts_payload = {
     "Properties": {
@@ -60,8 +120,8 @@ if status != 200:
 xsts = json.loads(body)
 xsts_token = xsts["Token"]
 
-# Print shell-safe exports so you can do: eval "$(python src/get_xsts.py)"
-print(f'export XSTS_UHS="{uhs}"')
-print(f'export XSTS_TOKEN="{xsts_token}"')
-print(f'export XBL3_AUTH="XBL3.0 x={uhs};{xsts_token}"')
-print(f'export XSTS_RELYING_PARTY="{RELYING_PARTY}"')
+# Only cache when the XSTS expiry is known
+if parse_expiry(xsts.get("NotAfter")):
+    save_cached_tokens(xbl_token, xsts_token, uhs, xsts["NotAfter"])
+
+print_exports(uhs, xsts_token)
@@ -1,31 +1,50 @@
 #!/usr/bin/env python3
-"""Convert a GiantBomb-style JSON dump into newline-delimited JSON."""
+"""Convert a GiantBomb-style JSON dump into newline-delimited JSON.
+
+The streaming parser only supports integers that fit in 64 bits; wider
+integers are reported as an error rather than converted.
+"""
 
-import json
 import sys
 from pathlib import Path
-from typing import Iterable, Union
-
-JsonType = Union[dict, list]
-
-
-def iter_records(payload: JsonType) -> Iterable[dict]:
-    """Yield individual game records from object-or-array payloads."""
-    if isinstance(payload, dict):
-        for value in payload.values():
-            if isinstance(value, dict):
-                yield value
-            else:
-                raise ValueError("Object payload must contain dict values")
-    elif isinstance(payload, list):
-        for item in payload:
-            if isinstance(item, dict):
-                yield item
-            else:
-                raise ValueError("Array payload must contain dict items")
+from typing import BinaryIO, Iterable
+
+import ijson
+import orjson
+
+WRITE_BUFFER_SIZE = 1 << 20
+SNIFF_CHUNK_SIZE = 64
+
+
+def sniff_top_level(fh: BinaryIO) -> bytes:
+    """Return the first non-whitespace byte of the document and rewind."""
+    first = b""
+    while chunk := fh.read(SNIFF_CHUNK_SIZE):
+        stripped = chunk.lstrip()
+        if stripped:
+            first = stripped[:1]
+            break
+    fh.seek(0)
+    return first
+
+
+def iter_records(fh: BinaryIO) -> Iterable[dict]:
+    """Stream individual game records from object-or-array payloads."""
+    top_level = sniff_top_level(fh)
+    if top_level == b"{":
+        items = (value for _, value in ijson.kvitems(fh, "", use_float=True))
+        error = "Object payload must contain dict values"
+    elif top_level == b"[":
+        items = ijson.items(fh, "item", use_float=True)
+        error = "Array payload must contain dict items"
     else:
         raise TypeError("Expected top-level JSON object or array")
 
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError(error)
+        yield item
+
 
 def main() -> int:
     match sys.argv[1:]:
@@ -37,7 +56,8 @@ def main() -> int:
             dst_path = Path(dst)
         case _:
             print(
-                "Usage: json_to_ndjson.py <source.json> [dest.ndjson]",
+                "Usage: json_to_ndjson.py <source.json> [dest.ndjson]\n"
+                "Integers must fit in 64 bits.",
                 file=sys.stderr,
             )
             return 1
@@ -46,12 +66,20 @@ def main() -> int:
         print(f"Source file not found: {src_path}", file=sys.stderr)
         return 1
 
-    payload = json.loads(src_path.read_text())
-
-    with dst_path.open("w", encoding="utf-8") as fh:
-        for record in iter_records(payload):
-            json.dump(record, fh, ensure_ascii=False)
-            fh.write("\n")
+    try:
+        with src_path.open("rb") as src_fh, dst_path.open("wb", buffering=WRITE_BUFFER_SIZE) as fh:
+            for record in iter_records(src_fh):
+                fh.write(orjson.dumps(record))
+                fh.write(b"\n")
+    except ijson.JSONError as e:
+        if "integer overflow" not in str(e):
+            raise
+        dst_path.unlink(missing_ok=True)
+        print(
+            f"{src_path} contains an integer wider than 64 bits, which is not supported:\n{e}",
+            file=sys.stderr,
+        )
+        return 1
 
     print(f"Wrote {dst_path}")
     return 0
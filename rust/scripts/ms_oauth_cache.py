@@ -1,15 +1,35 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import base64
+import functools
 import json
 import os
-import stat
+import pickle
+import random
+import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Mapping, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib
+    orjson = None
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+try:
+    import msgpack
+except ImportError:  # optional; pickle is the binary fallback
+    msgpack = None
+
 
 DEBUG = os.environ.get("MS_DEBUG", "").strip().lower() in ("1", "true", "yes", "y", "on")
 
@@ -24,24 +44,23 @@ def _safe_prefix(s: str, n: int = 400) -> str:
     return s[:n].replace("\n", "\\n")
 
 
+@functools.lru_cache(maxsize=4)
 def _decode_jwt_claims(token: Optional[str]) -> Dict[str, Any]:
     """Best-effort decode of a JWT payload without verifying signature.
 
-    Useful for debugging which account/token you received.
+    Useful for debugging which account/token you received. The result is
+    memoized per token, so treat the returned dict as read-only.
     """
     if not token:
         return {}
-    parts = token.split(".")
-    if len(parts) < 2:
+    try:
+        _, payload_b64, _ = token.split(".", 2)
+    except ValueError:
         return {}
-    import base64
-
-    payload_b64 = parts[1]
     # base64url pad
-    pad = "=" * ((4 - (len(payload_b64) % 4)) % 4)
+    pad = "=" * (-len(payload_b64) % 4)
     try:
-        payload = base64.urlsafe_b64decode((payload_b64 + pad).encode("utf-8"))
-        return json.loads(payload.decode("utf-8"))
+        return _loads(base64.urlsafe_b64decode(payload_b64 + pad))
     except Exception:
         return {}
 
@@ -53,17 +72,46 @@ TOKEN_URL = f"{AUTH_BASE}/token"
 
 # Use the client_id you just proved works (the script that printed microsoft.com/link)
 # If you used a different one, paste it here.
+# Checked when a token request is made, so importing this module does not need it.
 CLIENT_ID = os.environ.get("MS_CLIENT_ID", "").strip()
-if not CLIENT_ID:
-    raise SystemExit("Set MS_CLIENT_ID env var to the working client_id you used.")
 
 # Minimal identity scopes for “always succeeds”
 SCOPES = "openid profile offline_access"
 
-CACHE_PATH = Path(os.environ.get("MS_TOKEN_CACHE", "~/.config/msauth/device_token.json")).expanduser()
-
-
-@dataclass
+# The token cache is machine-read only, so it is stored in a binary format
+# (msgpack or pickle, recorded in a leading tag byte; see _serialize).
+# LEGACY_CACHE_PATH is the old indented-JSON cache, migrated on first load. A path
+# set in MS_TOKEN_CACHE is used as-is and migrated in place.
+if os.environ.get("MS_TOKEN_CACHE"):
+    CACHE_PATH = LEGACY_CACHE_PATH = Path(os.environ["MS_TOKEN_CACHE"]).expanduser()
+else:
+    CACHE_PATH = Path("~/.config/msauth/device_token.bin").expanduser()
+    LEGACY_CACHE_PATH = CACHE_PATH.with_suffix(".json")
+
+# In-process copy of the last TokenSet read or written, with the cache file's
+# mtime at that point; reused by load_cache until the file changes on disk.
+_CACHED: Optional[tuple[TokenSet, float]] = None
+_CACHED_LOCK = threading.Lock()
+
+# One keep-alive session for device-code polling and refreshes. Only connection
+# failures are retried (nothing was sent), so token POSTs are never replayed.
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(connect=3, read=0, status=0, backoff_factor=0.2),
+    ),
+)
+SESSION.headers.update({"Accept-Encoding": "gzip"})
+
+
+# TokenSet field order; from_json relies on it matching the class definition.
+_FIELDS = ("access_token", "refresh_token", "id_token", "expires_at", "scope", "token_type")
+
+
+@dataclass(slots=True, frozen=True)
 class TokenSet:
     access_token: Optional[str]
     refresh_token: Optional[str]
@@ -74,56 +122,138 @@ class TokenSet:
 
     @staticmethod
     def from_json(d: Dict[str, Any]) -> "TokenSet":
-        return TokenSet(
-            access_token=d.get("access_token"),
-            refresh_token=d.get("refresh_token"),
-            id_token=d.get("id_token"),
-            expires_at=d.get("expires_at"),
-            scope=d.get("scope"),
-            token_type=d.get("token_type"),
-        )
+        return TokenSet(*(d.get(k) for k in _FIELDS))
 
     def to_json(self) -> Dict[str, Any]:
-        return {
-            "access_token": self.access_token,
-            "refresh_token": self.refresh_token,
-            "id_token": self.id_token,
-            "expires_at": self.expires_at,
-            "scope": self.scope,
-            "token_type": self.token_type,
-        }
-
-
-def _mkdir_secure(path: Path) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
+        return {k: getattr(self, k) for k in _FIELDS}
+
+    def with_updated(self, **kw: Any) -> "TokenSet":
+        return replace(self, **kw)
+
+
+@functools.lru_cache(maxsize=1)
+def _mkdir_secure(directory: Path) -> None:
+    # Only runs once per directory per process; the cache dir rarely changes.
+    directory.mkdir(parents=True, exist_ok=True)
     # Best-effort: ensure directory is user-only
     try:
-        os.chmod(path.parent, 0o700)
+        os.chmod(directory, 0o700)
     except Exception:
         pass
 
 
-def _write_secure(path: Path, data: Dict[str, Any]) -> None:
-    _mkdir_secure(path)
-    tmp = path.with_suffix(".tmp")
-    tmp.write_text(json.dumps(data, indent=2))
-    # Ensure file mode 600
-    os.chmod(tmp, stat.S_IRUSR | stat.S_IWUSR)
-    tmp.replace(path)
+# The first byte of the cache file records its format, so a cache written
+# before/after msgpack was installed stays readable.
+_TAG_MSGPACK = b"M"
+_TAG_PICKLE = b"P"
 
 
-def load_cache() -> Optional[TokenSet]:
-    if not CACHE_PATH.exists():
+def _serialize(tok: TokenSet) -> bytes:
+    if msgpack is not None:
+        return _TAG_MSGPACK + msgpack.packb(tok.to_json(), use_bin_type=True)
+    return _TAG_PICKLE + pickle.dumps(tok.to_json(), protocol=5)
+
+
+def _deserialize(data: bytes) -> Dict[str, Any]:
+    tag, payload = data[:1], data[1:]
+    if tag == _TAG_PICKLE:
+        return pickle.loads(payload)
+    if tag == _TAG_MSGPACK:
+        if msgpack is None:
+            raise RuntimeError(f"{CACHE_PATH} was written with msgpack; install msgpack to read it")
+        return msgpack.unpackb(payload, raw=False)
+    raise ValueError(f"unknown token cache format tag {tag!r}")
+
+
+def _write_secure(path: Path, data: bytes) -> None:
+    _mkdir_secure(path.parent)
+    tmp = f"{path}.tmp"
+    # Mode 600 is set at create time, so no separate chmod is needed
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+
+
+def _migrate_legacy_cache(data: Optional[bytes] = None) -> Optional[TokenSet]:
+    """One-shot migration of the old JSON cache to the binary cache.
+
+    `data` is passed when CACHE_PATH itself still holds JSON; otherwise
+    LEGACY_CACHE_PATH is read.
+    """
+    if data is None:
+        try:
+            with open(LEGACY_CACHE_PATH, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+    try:
+        tok = TokenSet.from_json(_loads(data))
+    except Exception:
         return None
+    save_cache(tok)
+    if LEGACY_CACHE_PATH != CACHE_PATH:
+        LEGACY_CACHE_PATH.unlink(missing_ok=True)
+    _log(f"migrated token cache {LEGACY_CACHE_PATH} -> {CACHE_PATH}")
+    return tok
+
+
+def load_cache() -> Optional[TokenSet]:
+    global _CACHED
+    try:
+        with open(CACHE_PATH, "rb") as f:
+            mtime = os.fstat(f.fileno()).st_mtime
+            with _CACHED_LOCK:
+                if _CACHED is not None and _CACHED[1] == mtime:
+                    return _CACHED[0]
+            data = f.read()
+    except FileNotFoundError:
+        return _migrate_legacy_cache()
+    if data.lstrip()[:1] == b"{":
+        return _migrate_legacy_cache(data)
     try:
-        d = json.loads(CACHE_PATH.read_text())
-        return TokenSet.from_json(d)
+        tok = TokenSet.from_json(_deserialize(data))
     except Exception:
         return None
+    with _CACHED_LOCK:
+        _CACHED = (tok, mtime)
+    return tok
 
 
 def save_cache(tok: TokenSet) -> None:
-    _write_secure(CACHE_PATH, tok.to_json())
+    global _CACHED
+    _write_secure(CACHE_PATH, _serialize(tok))
+    with _CACHED_LOCK:
+        _CACHED = (tok, CACHE_PATH.stat().st_mtime)
+
+
+# Device-code polling: pad the server interval by 20% (never below it, even with
+# +/-10% jitter) and grow it by 40% (at least the RFC 8628 +5s) on slow_down.
+POLL_SAFETY_FACTOR = 1.2
+SLOW_DOWN_FACTOR = 1.4
+POLL_JITTER = (0.9, 1.1)
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Parse a Retry-After header given either as delta-seconds or an HTTP date.
+
+    `headers` must look up names case-insensitively, as requests and httpx headers do.
+    """
+    value = (headers.get("Retry-After") or "").strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
 
 def is_access_token_valid(tok: TokenSet, skew_seconds: int = 60) -> bool:
@@ -132,11 +262,24 @@ def is_access_token_valid(tok: TokenSet, skew_seconds: int = 60) -> bool:
     return int(time.time()) + skew_seconds < int(tok.expires_at)
 
 
-def device_code_login() -> TokenSet:
-    _log(f"DEVICE_CODE_URL={DEVICE_CODE_URL} tenant={TENANT} client_id={CLIENT_ID!r} scopes={SCOPES!r}")
-    r = requests.post(
+def _require_client_id(client_id: Optional[str] = None) -> str:
+    client_id = client_id or CLIENT_ID
+    if not client_id:
+        raise SystemExit("Set MS_CLIENT_ID env var to the working client_id you used.")
+    return client_id
+
+
+def device_code_login(client_id: Optional[str] = None, save: bool = True) -> TokenSet:
+    """Interactive device-code sign-in; `client_id` defaults to MS_CLIENT_ID.
+
+    With save=False the tokens are returned without touching the cache (used by
+    msal.py to smoke-test a different client).
+    """
+    client_id = _require_client_id(client_id)
+    _log(f"DEVICE_CODE_URL={DEVICE_CODE_URL} tenant={TENANT} client_id={client_id!r} scopes={SCOPES!r}")
+    r = SESSION.post(
         DEVICE_CODE_URL,
-        data={"client_id": CLIENT_ID, "scope": SCOPES},
+        data={"client_id": client_id, "scope": SCOPES},
         timeout=30,
     )
     _log(f"devicecode HTTP={r.status_code} content-type={r.headers.get('content-type')!r} body_prefix={_safe_prefix(r.text)!r}")
@@ -147,37 +290,36 @@ def device_code_login() -> TokenSet:
         # Microsoft usually returns JSON with fields like error/error_description.
         if "application/json" in ct:
             try:
-                j = r.json()
+                j = _loads(r.content)
             except Exception:
                 j = {"_parse_error": True, "body_prefix": body_prefix}
             raise RuntimeError(
                 "Device code request failed. "
                 f"HTTP={r.status_code} content_type={r.headers.get('content-type')} "
-                f"client_id={CLIENT_ID!r} scopes={SCOPES!r} response={j!r}"
+                f"client_id={client_id!r} scopes={SCOPES!r} response={j!r}"
             )
         raise RuntimeError(
             "Device code request failed. "
             f"HTTP={r.status_code} content_type={r.headers.get('content-type')} "
-            f"client_id={CLIENT_ID!r} scopes={SCOPES!r} body_prefix={body_prefix!r}"
+            f"client_id={client_id!r} scopes={SCOPES!r} body_prefix={body_prefix!r}"
         )
 
-    dc = r.json()
+    dc = _loads(r.content)
 
     # Microsoft returns a user-friendly message already
     print(dc.get("message") or f"Go to {dc['verification_uri']} and enter {dc['user_code']}")
 
-    interval = int(dc.get("interval", 5))
+    interval = int(dc.get("interval", 5)) * POLL_SAFETY_FACTOR
     deadline = time.time() + int(dc.get("expires_in", 900))
 
+    # Poll right away (the user may already be signed in), then back off between polls.
     while time.time() < deadline:
-        time.sleep(interval)
-
-        _log(f"polling token endpoint {TOKEN_URL} (interval={interval}s)")
-        tr = requests.post(
+        _log(f"polling token endpoint {TOKEN_URL} (interval={interval:.1f}s)")
+        tr = SESSION.post(
             TOKEN_URL,
             data={
                 "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
-                "client_id": CLIENT_ID,
+                "client_id": client_id,
                 "device_code": dc["device_code"],
             },
             timeout=30,
@@ -185,7 +327,7 @@ def device_code_login() -> TokenSet:
         _log(f"token HTTP={tr.status_code} content-type={tr.headers.get('content-type')!r} body_prefix={_safe_prefix(tr.text)!r}")
 
         if tr.status_code == 200:
-            t = tr.json()
+            t = _loads(tr.content)
             expires_in = int(t.get("expires_in", 3600))
             tok = TokenSet(
                 access_token=t.get("access_token"),
@@ -195,14 +337,18 @@ def device_code_login() -> TokenSet:
                 scope=t.get("scope"),
                 token_type=t.get("token_type"),
             )
-            save_cache(tok)
+            if save:
+                save_cache(tok)
             return tok
 
-        body = tr.json()
+        body = _loads(tr.content)
         err = body.get("error")
         if err in ("authorization_pending", "slow_down"):
             if err == "slow_down":
-                interval += 5
+                interval = max(interval + 5, interval * SLOW_DOWN_FACTOR)
+            retry_after = retry_after_seconds(tr.headers)
+            delay = retry_after if retry_after is not None else interval * random.uniform(*POLL_JITTER)
+            time.sleep(max(0.0, min(delay, deadline - time.time())))
             continue
 
         raise RuntimeError(f"Device code token failed: {body}")
@@ -213,12 +359,13 @@ def device_code_login() -> TokenSet:
 def refresh(tok: TokenSet) -> TokenSet:
     if not tok.refresh_token:
         raise RuntimeError("No refresh_token in cache; need interactive device login.")
+    client_id = _require_client_id()
 
-    _log(f"refresh token endpoint {TOKEN_URL} client_id={CLIENT_ID!r} scope={SCOPES!r}")
-    r = requests.post(
+    _log(f"refresh token endpoint {TOKEN_URL} client_id={client_id!r} scope={SCOPES!r}")
+    r = SESSION.post(
         TOKEN_URL,
         data={
-            "client_id": CLIENT_ID,
+            "client_id": client_id,
             "grant_type": "refresh_token",
             "refresh_token": tok.refresh_token,
             # scope optional in v2 refresh; including it can restrict/shape returned tokens.
@@ -232,22 +379,20 @@ def refresh(tok: TokenSet) -> TokenSet:
     # Helpful debugging if refresh fails
     if r.status_code != 200:
         try:
-            j = r.json()
+            j = _loads(r.content)
         except Exception:
             raise RuntimeError(f"Refresh failed: HTTP {r.status_code} {r.text[:300]!r}")
         raise RuntimeError(f"Refresh failed: {j}")
 
-    t = r.json()
+    t = _loads(r.content)
     expires_in = int(t.get("expires_in", 3600))
 
     # Microsoft may rotate refresh tokens — always persist the newest one.
-    new_tok = TokenSet(
+    # Fields missing from the response keep their cached values.
+    new_tok = tok.with_updated(
         access_token=t.get("access_token"),
-        refresh_token=t.get("refresh_token") or tok.refresh_token,
-        id_token=t.get("id_token") or tok.id_token,
         expires_at=int(time.time()) + expires_in,
-        scope=t.get("scope") or tok.scope,
-        token_type=t.get("token_type") or tok.token_type,
+        **{k: t[k] for k in ("refresh_token", "id_token", "scope", "token_type") if t.get(k)},
     )
     save_cache(new_tok)
     return new_tok
@@ -1,19 +1,56 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import asyncio
 import json
 import os
+import random
 import time
 from pathlib import Path
 from urllib.parse import urlparse, unquote, quote
 
-import requests
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+except ImportError:  # optional; fall back to HTTP/1.1 keep-alive
+    HTTP2 = False
+else:
+    HTTP2 = True
+
+# Device-code polling shares its backoff with ms_oauth_cache.device_code_login.
+from ms_oauth_cache import POLL_JITTER, POLL_SAFETY_FACTOR, SLOW_DOWN_FACTOR, retry_after_seconds
+
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib
+    orjson = None
+
+if orjson is not None:
+    _loads = orjson.loads
+    _dumps_body = orjson.dumps
+
+    def _dumps(obj: object) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+else:
+    _loads = json.loads
+
+    def _dumps_body(obj: object) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def _dumps(obj: object) -> bytes:
+        return json.dumps(obj, indent=2).encode("utf-8")
+
 
 # Xbox Live uses Microsoft Account (login.live.com) tokens ("service::user.auth.xboxlive.com::MBI_SSL").
 LIVE_CLIENT_ID = "0000000048093EE3"  # official Xbox/Microsoft Account client id used by xbox-webapi-ex
 LIVE_REDIRECT_URI = "https://login.live.com/oauth20_desktop.srf"
 LIVE_SCOPE = "service::user.auth.xboxlive.com::MBI_SSL"
 LIVE_AUTHORIZE_URL = "https://login.live.com/oauth20_authorize.srf"
+LIVE_DEVICE_CODE_URL = "https://login.live.com/oauth20_connect.srf"
+LIVE_TOKEN_URL = "https://login.live.com/oauth20_token.srf"
+# Errors meaning this client can't use device-code; fall back to the browser flow.
+LIVE_DEVICE_CODE_UNSUPPORTED = ("invalid_grant_type", "unsupported_grant_type")
 
 CACHE = Path(os.environ.get("XBOX_TOKEN_OUT", "./xbox_tokens.json")).expanduser()
 
@@ -23,8 +60,42 @@ XSTS_AUTH_URL = "https://xsts.auth.xboxlive.com/xsts/authorize"
 
 UA = "Mozilla/5.0 (Macintosh; Intel Mac OS X) xbox-webapi-ex/diagnostic"
 
-
-def log_resp(prefix: str, r: requests.Response) -> None:
+XBL_MAX_IN_FLIGHT = 8  # concurrent fallback XBL probes; more risks throttling
+PLAYWRIGHT_WAIT_SLICE_MS = 1000  # browser sign-in: how often to check redirects captured in other frames
+
+# Invariant parts of the XBL user/authenticate request; only RpsTicket, RelyingParty
+# and the contract header vary across the attempt matrix.
+_BASE_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+    # Be closer to real traffic; some backends behave differently with bare UA.
+    "User-Agent": UA,
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "DNT": "1",
+}
+_HEADERS_WITH_CONTRACT = {**_BASE_HEADERS, "x-xbl-contract-version": "1"}
+_XBL_PROPERTIES = {"AuthMethod": "RPS", "SiteName": "user.auth.xboxlive.com"}
+
+
+def new_client() -> httpx.AsyncClient:
+    """One client for the whole run: a single (HTTP/2 when available) connection per host.
+
+    The transport only retries connection failures (nothing was sent), so auth
+    POSTs are never replayed.
+    """
+    return httpx.AsyncClient(
+        timeout=30.0,
+        headers={"User-Agent": UA, "Accept-Encoding": "gzip"},
+        transport=httpx.AsyncHTTPTransport(
+            http2=HTTP2,
+            retries=3,
+            limits=httpx.Limits(max_connections=16),
+        ),
+    )
+
+
+def log_resp(prefix: str, r: httpx.Response) -> None:
     ct = r.headers.get("content-type")
     # Helpful for XBL errors (they often return empty body but include correlation headers)
     hdrs = {k: v for k, v in r.headers.items() if k.lower() in ("ms-cv", "x-xblcorrelationid", "date", "server")}
@@ -36,6 +107,96 @@ def log_resp(prefix: str, r: requests.Response) -> None:
     print(f"{prefix} BODY_PREFIX: {body[:400].replace(chr(10),'\\n')}")
 
 
+class LiveDeviceCodeUnsupported(RuntimeError):
+    """Device-code sign-in is unavailable for LIVE_CLIENT_ID; use the browser flow instead."""
+
+
+async def live_msa_tokens_via_device_code(client: httpx.AsyncClient) -> dict:
+    """Get a login.live.com token for LIVE_SCOPE with the OAuth 2.0 device-code flow.
+
+    Polls with the same backoff as ms_oauth_cache.device_code_login. Raises
+    LiveDeviceCodeUnsupported if no code could be obtained, or if polling reports
+    the grant unsupported, so callers can fall back to the browser flow.
+    """
+    # No code has been shown to the user yet, so any failure here falls back.
+    try:
+        r = await client.post(
+            LIVE_DEVICE_CODE_URL,
+            data={"client_id": LIVE_CLIENT_ID, "scope": LIVE_SCOPE, "response_type": "device_code"},
+        )
+    except httpx.HTTPError as e:
+        raise LiveDeviceCodeUnsupported(f"Device code request failed: {e!r}") from e
+    try:
+        dc = _loads(r.content)
+    except Exception:
+        dc = None
+    if r.status_code != 200 or not isinstance(dc, dict) or "device_code" not in dc:
+        log_resp("LIVE-DEVICECODE", r)
+        raise LiveDeviceCodeUnsupported(f"Device code request rejected: HTTP {r.status_code} {dc!r}")
+
+    print(dc.get("message") or f"Go to {dc['verification_uri']} and enter {dc['user_code']}")
+
+    interval = int(dc.get("interval", 5)) * POLL_SAFETY_FACTOR
+    try:
+        return await asyncio.wait_for(
+            _poll_live_device_code(client, dc["device_code"], interval),
+            timeout=int(dc.get("expires_in", 900)),
+        )
+    except asyncio.TimeoutError:
+        raise TimeoutError("Device code expired before you finished signing in.") from None
+
+
+async def _poll_live_device_code(client: httpx.AsyncClient, device_code: str, interval: float) -> dict:
+    # Poll right away (the user may already be signed in), then back off between polls.
+    # The caller bounds this loop with the device code's expires_in.
+    while True:
+        tr = await client.post(
+            LIVE_TOKEN_URL,
+            data={
+                "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
+                "client_id": LIVE_CLIENT_ID,
+                "device_code": device_code,
+            },
+        )
+        if tr.status_code == 200:
+            t = _loads(tr.content)
+            return {
+                # Token endpoint values are not URL-encoded, so there is no separate raw form.
+                "access_token_raw": None,
+                "access_token": t.get("access_token"),
+                "refresh_token_raw": None,
+                "refresh_token": t.get("refresh_token"),
+                "token_type": t.get("token_type"),
+                "expires_in": t.get("expires_in"),
+                "scope": t.get("scope"),
+                "user_id": t.get("user_id"),
+                "redirect_url": None,
+            }
+
+        try:
+            body = _loads(tr.content)
+        except Exception:
+            log_resp("LIVE-TOKEN", tr)
+            raise RuntimeError(f"login.live.com device code token failed: {tr.status_code}")
+        err = body.get("error")
+        if err in ("authorization_pending", "slow_down"):
+            if err == "slow_down":
+                interval = max(interval + 5, interval * SLOW_DOWN_FACTOR)
+            retry_after = retry_after_seconds(tr.headers)
+            delay = retry_after if retry_after is not None else interval * random.uniform(*POLL_JITTER)
+            await asyncio.sleep(delay)
+            continue
+        if err in LIVE_DEVICE_CODE_UNSUPPORTED:
+            raise LiveDeviceCodeUnsupported(f"Device code token rejected: {body}")
+
+        raise RuntimeError(f"login.live.com device code token failed: {body}")
+
+
+def _is_token_redirect(url: str | None) -> bool:
+    # Accept querystring variants (e.g. oauth20_desktop.srf?lc=1033#access_token=...)
+    return bool(url) and url.startswith(LIVE_REDIRECT_URI) and "#" in url and "access_token=" in url
+
+
 def live_msa_tokens_via_playwright(timeout_seconds: int = 600) -> dict:
     """Launch a browser and capture the final redirect URL containing #access_token=... from login.live.com.
 
@@ -44,7 +205,7 @@ def live_msa_tokens_via_playwright(timeout_seconds: int = 600) -> dict:
       python -m playwright install chromium
     """
     try:
-        from playwright.sync_api import sync_playwright
+        from playwright.sync_api import Error as PlaywrightError, sync_playwright
     except Exception as e:
         raise RuntimeError(
             "Playwright is required for programmatic capture. Install with:\n"
@@ -62,7 +223,7 @@ def live_msa_tokens_via_playwright(timeout_seconds: int = 600) -> dict:
         "locale": "en",
     }
 
-    q = "&".join([f"{k}={requests.utils.quote(str(v), safe='')}" for k, v in params.items()])
+    q = "&".join([f"{k}={quote(str(v), safe='')}" for k, v in params.items()])
     auth_url = f"{LIVE_AUTHORIZE_URL}?{q}"
 
     print("Open/sign-in in the browser window. Waiting for redirect to:", LIVE_REDIRECT_URI)
@@ -78,13 +239,7 @@ def live_msa_tokens_via_playwright(timeout_seconds: int = 600) -> dict:
                 href = p.evaluate("() => window.location.href")
             except Exception:
                 href = p.url
-            if (
-                captured["url"] is None
-                and href
-                and href.startswith(LIVE_REDIRECT_URI)
-                and "#" in href
-                and "access_token=" in href
-            ):
+            if captured["url"] is None and _is_token_redirect(href):
                 captured["url"] = href
             return href
 
@@ -96,7 +251,7 @@ def live_msa_tokens_via_playwright(timeout_seconds: int = 600) -> dict:
         def on_nav(frame):
             u = frame.url
             print("NAV:", u)
-            if captured["url"] is None and u.startswith(LIVE_REDIRECT_URI) and "access_token=" in u and "#" in u:
+            if captured["url"] is None and _is_token_redirect(u):
                 captured["url"] = u
 
         page.on("framenavigated", on_nav)
@@ -114,95 +269,96 @@ def live_msa_tokens_via_playwright(timeout_seconds: int = 600) -> dict:
 
         page.goto(auth_url)
 
-        deadline = time.time() + timeout_seconds
-        last_url: str | None = None
-
-        while time.time() < deadline:
-            # Prefer a captured redirect URL from any frame. This avoids missing the token
-            # when the browser immediately navigates away after hitting oauth20_desktop.srf.
-            url = captured.get("url")
-
-            if not url:
-                # Scan the current page quickly; this is critical because the redirect
-                # with the fragment can appear and disappear very quickly.
-                url = scan_page_for_token(page)
-
-                if url != last_url:
-                    print("URL:", url)
-                    last_url = url
-
-                # Additionally, try a very short wait for the token to appear.
-                # This avoids missing a transient fragment between polls.
-                if captured["url"] is None:
-                    try:
-                        page.wait_for_function(
-                            """(redirect) => {
-                                try {
-                                    const href = window.location.href || '';
-                                    return href.startsWith(redirect) && href.includes('#') && href.includes('access_token=');
-                                } catch (e) { return false; }
-                            }""",
-                            arg=LIVE_REDIRECT_URI,
-                            timeout=200,
-                        )
-                        url = scan_page_for_token(page)
-                    except Exception:
-                        pass
-
-            # Accept querystring variants (e.g. oauth20_desktop.srf?lc=1033#access_token=...)
-            if url and url.startswith(LIVE_REDIRECT_URI) and "access_token=" in url and "#" in url:
-                parsed = urlparse(url)
-
-                # IMPORTANT: do NOT use parse_qs here; it uses unquote_plus, which can corrupt tokens.
-                # We decode using unquote so '+' remains '+' (not space).
-                frag_raw: dict[str, str] = {}
-                frag_decoded: dict[str, str] = {}
-
-                for part in (parsed.fragment or "").split("&"):
-                    if not part:
-                        continue
-                    if "=" not in part:
-                        frag_raw[part] = ""
-                        frag_decoded[part] = ""
-                        continue
-                    k, v = part.split("=", 1)
-                    # Keep the raw fragment value EXACTLY as provided by the browser
-                    # (it may already contain '/' and other non-escaped characters).
-                    frag_raw[k] = v
-                    # Also keep a percent-decoded version. Use unquote (NOT unquote_plus)
-                    # so '+' remains '+' (not space).
-                    frag_decoded[k] = unquote(v)
-                print("Captured fragment keys:", sorted(frag_decoded.keys()))
-
-                if "access_token" not in frag_raw and "access_token" not in frag_decoded:
-                    raise RuntimeError(f"Redirect reached but missing access_token fragment: {url}")
-
-                token = {
-                    # For XBL, we'll try multiple variants later.
-                    "access_token_raw": frag_raw.get("access_token"),
-                    "access_token": frag_decoded.get("access_token") or frag_raw.get("access_token"),
-                    "refresh_token_raw": frag_raw.get("refresh_token"),
-                    "refresh_token": frag_decoded.get("refresh_token") or frag_raw.get("refresh_token"),
-                    "token_type": frag_decoded.get("token_type") or frag_raw.get("token_type"),
-                    "expires_in": frag_decoded.get("expires_in") or frag_raw.get("expires_in"),
-                    "scope": frag_decoded.get("scope") or frag_raw.get("scope"),
-                    "user_id": frag_decoded.get("user_id") or frag_raw.get("user_id"),
-                    "redirect_url": url,
-                }
-
-                ctx.close()
-                browser.close()
-                return token
-
-            time.sleep(0.02)
+        # Wait for the main page to commit the redirect, in slices so that a redirect
+        # captured by the framenavigated handlers (popups, sub-frames, new pages)
+        # also ends the wait. Playwright only dispatches those events while a call
+        # like wait_for_url is blocking.
+        def is_main_redirect(u: str) -> bool:
+            # Record the URL as it matches; the page may navigate away right after.
+            if captured["url"] is None and _is_token_redirect(u):
+                captured["url"] = u
+            return captured["url"] is not None
+
+        deadline = time.monotonic() + timeout_seconds
+        while captured["url"] is None and time.monotonic() < deadline and not page.is_closed():
+            try:
+                page.wait_for_url(is_main_redirect, timeout=PLAYWRIGHT_WAIT_SLICE_MS, wait_until="commit")
+            except PlaywrightError:
+                # Timeouts, or the redirect page navigating away mid-wait.
+                pass
+
+        # Prefer a captured redirect URL from any frame. This avoids missing the token
+        # when the browser immediately navigates away after hitting oauth20_desktop.srf.
+        url = captured["url"] or (None if page.is_closed() else scan_page_for_token(page))
+
+        if not _is_token_redirect(url):
+            ctx.close()
+            browser.close()
+            raise TimeoutError(f"Timed out waiting for login.live.com redirect with access_token. last_url={url!r}")
+
+        parsed = urlparse(url)
+
+        # IMPORTANT: do NOT use parse_qs here; it uses unquote_plus, which can corrupt tokens.
+        # We decode using unquote so '+' remains '+' (not space).
+        frag_raw: dict[str, str] = {}
+        frag_decoded: dict[str, str] = {}
+
+        for part in (parsed.fragment or "").split("&"):
+            if not part:
+                continue
+            if "=" not in part:
+                frag_raw[part] = ""
+                frag_decoded[part] = ""
+                continue
+            k, v = part.split("=", 1)
+            # Keep the raw fragment value EXACTLY as provided by the browser
+            # (it may already contain '/' and other non-escaped characters).
+            frag_raw[k] = v
+            # Also keep a percent-decoded version. Use unquote (NOT unquote_plus)
+            # so '+' remains '+' (not space).
+            frag_decoded[k] = unquote(v)
+        print("Captured fragment keys:", sorted(frag_decoded.keys()))
+
+        if "access_token" not in frag_raw and "access_token" not in frag_decoded:
+            raise RuntimeError(f"Redirect reached but missing access_token fragment: {url}")
+
+        token = {
+            # For XBL, we'll try multiple variants later.
+            "access_token_raw": frag_raw.get("access_token"),
+            "access_token": frag_decoded.get("access_token") or frag_raw.get("access_token"),
+            "refresh_token_raw": frag_raw.get("refresh_token"),
+            "refresh_token": frag_decoded.get("refresh_token") or frag_raw.get("refresh_token"),
+            "token_type": frag_decoded.get("token_type") or frag_raw.get("token_type"),
+            "expires_in": frag_decoded.get("expires_in") or frag_raw.get("expires_in"),
+            "scope": frag_decoded.get("scope") or frag_raw.get("scope"),
+            "user_id": frag_decoded.get("user_id") or frag_raw.get("user_id"),
+            "redirect_url": url,
+        }
 
         ctx.close()
         browser.close()
+        return token
 
-    raise TimeoutError(f"Timed out waiting for login.live.com redirect with access_token. last_url={last_url!r}")
 
+def load_xbl_ticket_shape() -> dict | None:
+    """Return the XBL ticket shape that succeeded last run, if the token cache recorded one."""
+    try:
+        return _loads(CACHE.read_bytes())["xbl"].get("ticket_shape")
+    except Exception:
+        return None
 
-def xbl_user_authenticate(ms_access_token: str, ms_access_token_raw: str | None = None) -> dict:
+
+async def xbl_user_authenticate(
+    client: httpx.AsyncClient,
+    ms_access_token: str,
+    ms_access_token_raw: str | None = None,
+    preferred_shape: dict | None = None,
+) -> tuple[dict, dict]:
+    """Exchange the MSA token for an XBL user token.
+
+    Returns the XBL response and the ticket shape (label, relying party, contract header)
+    that worked, so callers can pass it back as `preferred_shape` on the next run.
+    """
     # RpsTicket formatting is unfortunately inconsistent across samples and accounts.
     # We will try a small matrix:
     #   - raw token vs percent-decoded token
@@ -210,30 +366,24 @@ def xbl_user_authenticate(ms_access_token: str, ms_access_token_raw: str | None
     #   - with and without x-xbl-contract-version header
 
     relying_parties = ["http://auth.xboxlive.com", "https://auth.xboxlive.com"]
-    def attempt(rps_ticket: str, relying_party: str, with_contract_header: bool = True) -> requests.Response:
-        payload = {
-            "Properties": {
-                "AuthMethod": "RPS",
-                "SiteName": "user.auth.xboxlive.com",
-                "RpsTicket": rps_ticket,
-            },
-            # NOTE: samples vary between http/https; we will try both via outer loop.
-            "RelyingParty": relying_party,
-            "TokenType": "JWT",
-        }
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            # Be closer to real traffic; some backends behave differently with bare UA.
-            "User-Agent": UA,
-            "Accept-Language": "en-US,en;q=0.9",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Connection": "keep-alive",
-            "DNT": "1",
-        }
-        if with_contract_header:
-            headers["x-xbl-contract-version"] = "1"
-        return requests.post(XBL_AUTH_URL, headers=headers, json=payload, timeout=30)
+    async def attempt(body: bytes, headers: dict) -> httpx.Response:
+        return await client.post(XBL_AUTH_URL, headers=headers, content=body)
+
+    # Each body is serialized once per (ticket, relying party) and shared by the
+    # with/without contract header attempts.
+    bodies: dict[tuple[str, str], bytes] = {}
+
+    def request_for(shape: tuple[str, str, str, bool]) -> tuple[bytes, dict]:
+        _, rps_ticket, relying_party, with_contract = shape
+        body = bodies.get((rps_ticket, relying_party))
+        if body is None:
+            body = bodies[rps_ticket, relying_party] = _dumps_body({
+                "Properties": {**_XBL_PROPERTIES, "RpsTicket": rps_ticket},
+                # NOTE: samples vary between http/https; we will try both via outer loop.
+                "RelyingParty": relying_party,
+                "TokenType": "JWT",
+            })
+        return body, (_HEADERS_WITH_CONTRACT if with_contract else _BASE_HEADERS)
 
     # We may have two representations:
     #   - ms_access_token: decoded (percent-decoded) token
@@ -267,23 +417,23 @@ def xbl_user_authenticate(ms_access_token: str, ms_access_token_raw: str | None
             return
         tickets.append((label, ticket))
 
-    # Plain tokens
-    add("decoded", decoded)
+    # Plain tokens (the raw fragment is the shape that usually works for MSA tokens)
     add("rawfrag", raw_fragment)
+    add("decoded", decoded)
     add("rawfrag_decoded", raw_fragment_decoded)
 
     # Fully percent-encoded tokens (sometimes required by XBL)
-    add("decoded_enc", decoded_enc)
     add("rawfrag_enc", rawfrag_enc)
+    add("decoded_enc", decoded_enc)
     add("rawfrag_decoded_enc", rawfrag_decoded_enc)
 
     # Prefixed variants
     for base_label, base in [
-        ("decoded", decoded),
         ("rawfrag", raw_fragment),
+        ("decoded", decoded),
         ("rawfrag_decoded", raw_fragment_decoded),
-        ("decoded_enc", decoded_enc),
         ("rawfrag_enc", rawfrag_enc),
+        ("decoded_enc", decoded_enc),
         ("rawfrag_decoded_enc", rawfrag_decoded_enc),
     ]:
         add(f"d={base_label}", f"d={base}")
@@ -299,15 +449,61 @@ def xbl_user_authenticate(ms_access_token: str, ms_access_token_raw: str | None
         uniq.append((lbl, t))
 
     # Try with contract header first, then without.
-    attempts: list[tuple[str, requests.Response]] = []
+    shapes: list[tuple[str, str, str, bool]] = [
+        (lbl, t, relying_party, with_contract)
+        for relying_party in relying_parties
+        for with_contract in (True, False)
+        for lbl, t in uniq
+    ]
+
+    # Try the shape that worked last time before falling back to the full matrix.
+    if preferred_shape:
+        preferred_ticket = dict(tickets).get(preferred_shape.get("label"))
+        if preferred_ticket:
+            preferred = (
+                preferred_shape["label"],
+                preferred_ticket,
+                preferred_shape.get("relying_party", relying_parties[0]),
+                bool(preferred_shape.get("with_contract", True)),
+            )
+            shapes = [preferred] + [shape for shape in shapes if shape[1:] != preferred[1:]]
+
+    def describe(shape: tuple[str, str, str, bool]) -> str:
+        lbl, _, relying_party, with_contract = shape
+        return f"XBL({lbl},rp={relying_party},contract={with_contract})"
+
+    def success(shape: tuple[str, str, str, bool], r: httpx.Response) -> tuple[dict, dict]:
+        lbl, _, relying_party, with_contract = shape
+        return _loads(r.content), {"label": lbl, "relying_party": relying_party, "with_contract": with_contract}
+
+    # The head shape (cached or known-good) usually works, so try it alone first.
+    head, rest = shapes[0], shapes[1:]
+    r = await attempt(*request_for(head))
+    if r.status_code == 200:
+        return success(head, r)
+    attempts: list[tuple[int, str, httpx.Response]] = [(0, describe(head), r)]
+
+    # Fallback: the remaining probes are independent, so run them concurrently
+    # (capped to avoid XBL throttling; multiplexed over one connection on HTTP/2)
+    # and take the first 200.
+    in_flight = asyncio.Semaphore(XBL_MAX_IN_FLIGHT)
+
+    async def probe(index: int, shape: tuple[str, str, str, bool]) -> tuple[int, tuple[str, str, str, bool], httpx.Response]:
+        async with in_flight:
+            return index, shape, await attempt(*request_for(shape))
+
+    tasks = [asyncio.ensure_future(probe(index, shape)) for index, shape in enumerate(rest, start=1)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, shape, r = await next_done
+            if r.status_code == 200:
+                return success(shape, r)
+            attempts.append((index, describe(shape), r))
+    finally:
+        for task in tasks:
+            task.cancel()
 
-    for relying_party in relying_parties:
-        for with_contract in (True, False):
-            for lbl, t in uniq:
-                r = attempt(t, relying_party=relying_party, with_contract_header=with_contract)
-                if r.status_code == 200:
-                    return r.json()
-                attempts.append((f"XBL({lbl},rp={relying_party},contract={with_contract})", r))
+    attempts = [(lbl, r) for _, lbl, r in sorted(attempts, key=lambda a: a[0])]
 
     # Log the most informative failures (up to 12)
     for lbl, r in attempts[:12]:
@@ -318,7 +514,7 @@ def xbl_user_authenticate(ms_access_token: str, ms_access_token_raw: str | None
     raise RuntimeError(f"XBL user/authenticate failed. First attempts: {summary}")
 
 
-def xsts_authorize(xbl_token: str) -> dict:
+async def xsts_authorize(client: httpx.AsyncClient, xbl_token: str) -> dict:
     payload = {
         "Properties": {
             "SandboxId": "RETAIL",
@@ -333,15 +529,25 @@ def xsts_authorize(xbl_token: str) -> dict:
         "User-Agent": UA,
         "x-xbl-contract-version": "1",
     }
-    r = requests.post(XSTS_AUTH_URL, headers=headers, json=payload, timeout=30)
+    r = await client.post(XSTS_AUTH_URL, headers=headers, json=payload)
     if r.status_code != 200:
         log_resp("XSTS", r)
         raise RuntimeError(f"XSTS authorize failed: {r.status_code}")
-    return r.json()
+    return _loads(r.content)
 
 
-def main() -> None:
-    ms = live_msa_tokens_via_playwright()
+async def main_async() -> None:
+    async with new_client() as client:
+        await _run(client)
+
+
+async def _run(client: httpx.AsyncClient) -> None:
+    try:
+        ms = await live_msa_tokens_via_device_code(client)
+    except LiveDeviceCodeUnsupported as e:
+        print("Device code not available, falling back to browser sign-in:", e)
+        # The Playwright sync API refuses to run inside an event loop.
+        ms = await asyncio.to_thread(live_msa_tokens_via_playwright)
     # Prefer decoded token, but keep raw available for debug.
     ms_access_token = ms.get("access_token")
     ms_access_token_raw = ms.get("access_token_raw")
@@ -356,11 +562,11 @@ def main() -> None:
     if ms_access_token_raw:
         print("MS access_token_raw startswith:", (ms_access_token_raw[:6] + "..."))
 
-    xbl = xbl_user_authenticate(ms_access_token, ms_access_token_raw)
+    xbl, xbl_shape = await xbl_user_authenticate(client, ms_access_token, ms_access_token_raw, load_xbl_ticket_shape())
     xbl_token = xbl["Token"]
     uhs = xbl["DisplayClaims"]["xui"][0]["uhs"]
 
-    xsts = xsts_authorize(xbl_token)
+    xsts = await xsts_authorize(client, xbl_token)
     xsts_token = xsts["Token"]
     xid = xsts["DisplayClaims"]["xui"][0].get("xid")
 
@@ -375,16 +581,20 @@ def main() -> None:
             "access_token_raw_len": (len(ms_access_token_raw) if ms_access_token_raw else None),
             "redirect_url_prefix": (ms.get("redirect_url") or "")[:80],
         },
-        "xbl": {"uhs": uhs, "token": xbl_token},
+        "xbl": {"uhs": uhs, "token": xbl_token, "ticket_shape": xbl_shape},
         "xsts": {"uhs": xsts["DisplayClaims"]["xui"][0]["uhs"], "xid": xid, "token": xsts_token},
         "authorization_header": f"XBL3.0 x={uhs};{xsts_token}",
     }
 
-    CACHE.write_text(json.dumps(out, indent=2))
+    CACHE.write_bytes(_dumps(out))
     print("OK: wrote", str(CACHE))
     print("uhs:", uhs)
     print("auth header ready in xbox_tokens.json as authorization_header")
 
 
+def main() -> None:
+    asyncio.run(main_async())
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file